@@ -0,0 +1,110 @@
+"""
+ml/admission.py
+Deadline-aware admission control for the inference server
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+ADMIT = "admit"
+SHED = "shed"
+FALLBACK = "fallback"
+
+class AdmissionController:
+    """
+    Bounded inference queue with deadline-aware admission
+
+    Requests beyond max_queue_depth are shed outright. Requests carrying a
+    deadline the queue is predicted to miss are sent to the heuristic
+    fallback instead of waiting for the model.
+    """
+
+    def __init__(self, max_queue_depth=64, max_concurrency=1, initial_latency_ms=20.0, ewma_alpha=0.2):
+        self.max_queue_depth = max_queue_depth
+        self.max_concurrency = max_concurrency
+        self.ewma_alpha = ewma_alpha
+        self._latency_ms = initial_latency_ms
+        self._pending = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.counters = {
+            "admitted": 0,
+            "completed": 0,
+            "shed": 0,
+            "fallback": 0
+        }
+
+    def estimate_wait_ms(self):
+        """Predicted time until a newly queued request finishes inference"""
+        waves = self._pending // self.max_concurrency + 1
+        return waves * self._latency_ms
+
+    def decide(self, deadline_ms=None, elapsed_ms=0.0):
+        """
+        Decide how to handle an incoming request
+
+        Args:
+            deadline_ms: optional end-to-end budget for the request
+            elapsed_ms: time already spent on the request
+
+        Returns:
+            one of ADMIT, SHED or FALLBACK
+        """
+        if self._pending >= self.max_queue_depth:
+            self.counters["shed"] += 1
+            return SHED
+
+        if deadline_ms is not None and elapsed_ms + self.estimate_wait_ms() > deadline_ms:
+            self.counters["fallback"] += 1
+            return FALLBACK
+
+        self.counters["admitted"] += 1
+        return ADMIT
+
+    def still_in_time(self, deadline_ms, elapsed_ms):
+        """
+        Re-check the deadline once a request reaches the head of the queue
+
+        A request that falls back here moves from the admitted count to the
+        fallback count, so admitted + shed + fallback equals requests seen.
+        """
+        if deadline_ms is None or elapsed_ms + self._latency_ms <= deadline_ms:
+            return True
+        self.counters["admitted"] -= 1
+        self.counters["fallback"] += 1
+        return False
+
+    @asynccontextmanager
+    async def queued(self):
+        """Hold a queue position until an inference slot is free"""
+        self._pending += 1
+        try:
+            async with self._semaphore:
+                yield
+        finally:
+            self._pending -= 1
+
+    def observe(self, started):
+        """Fold one single-meal inference duration (from time.perf_counter()) into the latency estimate"""
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        self._latency_ms += self.ewma_alpha * (elapsed_ms - self._latency_ms)
+
+    def complete(self):
+        """Mark an admitted request as having finished model inference"""
+        self.counters["completed"] += 1
+
+    def stats(self):
+        """
+        Snapshot of queue state and counters
+
+        Every counter is per request, not per meal: admitted + shed + fallback
+        is the number of requests seen, and completed counts admitted requests
+        whose model inference has finished (the rest are in flight or failed).
+        """
+        return {
+            "queue_depth": self._pending,
+            "max_queue_depth": self.max_queue_depth,
+            "max_concurrency": self.max_concurrency,
+            "estimated_latency_ms": round(self._latency_ms, 3),
+            **self.counters
+        }
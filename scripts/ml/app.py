@@ -3,12 +3,36 @@ ml/app.py
 FastAPI inference server for nutrient deficiency prediction
 """
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Header, Response
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 from typing import Optional
+import asyncio
+import importlib
+from contextlib import nullcontext
 import numpy as np
 import logging
-from .model_utils import load_model_and_scaler, preprocess_input, interpret_predictions, generate_recommendations
+import os
+# Served as ml.app:app from scripts/, or as app:app from this directory (the Dockerfile)
+if __package__:
+    from .model_utils import (
+        load_model_and_scaler, preprocess_input, preprocess_rows, interpret_predictions, generate_recommendations,
+        heuristic_predict, extract_features, build_what_if_grid, find_threshold_crossings, get_risk_level
+    )
+    from .admission import AdmissionController, SHED, FALLBACK
+    from .profiling import start_profile, NULL_PROFILE
+    from .capture import TrafficCapture
+else:
+    from model_utils import (
+        load_model_and_scaler, preprocess_input, preprocess_rows, interpret_predictions, generate_recommendations,
+        heuristic_predict, extract_features, build_what_if_grid, find_threshold_crossings, get_risk_level
+    )
+    from admission import AdmissionController, SHED, FALLBACK
+    from profiling import start_profile, NULL_PROFILE
+    from capture import TrafficCapture
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -36,22 +60,101 @@ class PredictionResponse(BaseModel):
     risk_assessment: dict
     suggestions: list
     confidence_scores: dict
+    prediction_source: str = "model"  # "model" or "heuristic"
+    degraded: bool = False
+
+# Default largest change explored per nutrient by /what-if (same units as MealRequest)
+WHAT_IF_DEFAULT_CHANGE = {
+    "calories": 800.0,
+    "protein": 60.0,
+    "carbs": 150.0,
+    "fat": 50.0,
+    "iron": 20.0,
+    "vitaminC": 100.0
+}
+
+class WhatIfRequest(BaseModel):
+    meal: MealRequest
+    nutrients: list[str] = ["iron", "vitaminC", "protein"]
+    max_change: Optional[dict[str, float]] = None  # nutrient -> largest amount added (negative to reduce)
+    steps: int = Field(41, ge=2, le=401)
 
 # Global variables for model components
 model = None
 scaler = None
 feature_info = None
 
-@app.on_event("startup")
-async def load_model():
-    """Load model components on startup"""
+# Startup progress: "loading" -> "ready" or "failed"; stage timings in ms
+model_status = "loading"
+startup_error = None
+startup_report = {"imports_ms": round((time.perf_counter() - _IMPORT_STARTED) * 1000.0, 1)}
+STARTUP_BUDGET_MS = float(os.environ.get("ML_STARTUP_BUDGET_MS", "15000"))
+_model_loader = None
+
+# Bounded inference queue; requests past the depth are shed with a 503
+admission = AdmissionController(
+    max_queue_depth=int(os.environ.get("ML_MAX_QUEUE_DEPTH", "64")),
+    max_concurrency=int(os.environ.get("ML_MAX_CONCURRENCY", "1"))
+)
+
+# Sampled traffic capture for offline replay (see replay.py); off by default
+capture = TrafficCapture(
+    directory=os.environ.get("ML_CAPTURE_DIR", os.path.join(os.path.dirname(__file__), "captures")),
+    featurize=lambda meal: extract_features(meal.dict()),
+    sample_rate=float(os.environ.get("ML_CAPTURE_RATE", "0")),
+    max_bytes=int(os.environ.get("ML_CAPTURE_MAX_BYTES", str(64 * 1024 * 1024))),
+    max_files=int(os.environ.get("ML_CAPTURE_MAX_FILES", "20"))
+)
+
+def _load_and_warm_up():
+    """Load model artifacts and run one warmup prediction, timing each stage"""
     global model, scaler, feature_info
+    
+    # load_model_and_scaler imports these lazily; time them on their own
+    started = time.perf_counter()
+    for module in ("tensorflow", "joblib"):
+        importlib.import_module(module)
+    startup_report["dependency_import_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+    
+    started = time.perf_counter()
+    loaded_model, loaded_scaler, loaded_feature_info = load_model_and_scaler()
+    startup_report["artifact_load_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+    
+    started = time.perf_counter()
+    warmup_meal = MealRequest(calories=0.0, protein=0.0, carbs=0.0, fat=0.0)
+    loaded_model.predict(preprocess_input(warmup_meal.dict(), loaded_scaler, loaded_feature_info), verbose=0)
+    startup_report["warmup_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+    
+    # Publish only once warm so requests never pay for graph tracing
+    model, scaler, feature_info = loaded_model, loaded_scaler, loaded_feature_info
+
+async def _load_model_components():
+    global model_status, startup_error
     try:
-        model, scaler, feature_info = load_model_and_scaler()
-        logger.info("Model loaded successfully")
+        await run_in_threadpool(_load_and_warm_up)
     except Exception as e:
+        model_status = "failed"
+        startup_error = str(e)
         logger.error(f"Failed to load model: {e}")
-        raise
+        return
+    
+    startup_report["total_ms"] = round((time.perf_counter() - _IMPORT_STARTED) * 1000.0, 1)
+    model_status = "ready"
+    logger.info(f"Model loaded successfully: {startup_report}")
+    if startup_report["total_ms"] > STARTUP_BUDGET_MS:
+        logger.warning(f"Startup took {startup_report['total_ms']} ms, over the {STARTUP_BUDGET_MS:.0f} ms budget")
+
+@app.on_event("startup")
+async def load_model():
+    """Start loading model components in the background so /health answers immediately"""
+    global _model_loader
+    capture.start()
+    _model_loader = asyncio.get_running_loop().create_task(_load_model_components())
+
+@app.on_event("shutdown")
+async def flush_capture():
+    """Flush any captured traffic still queued for writing"""
+    await run_in_threadpool(capture.close)
 
 @app.get("/")
 async def root():
@@ -63,35 +166,130 @@ async def root():
     }
 
 @app.get("/health")
-async def health_check():
-    """Detailed health check"""
+async def health_check(response: Response):
+    """
+    Liveness check; answers while the model is still loading
+    
+    Returns 503 only if loading the model failed, so the process gets restarted.
+    Use /ready to decide whether to route traffic here.
+    """
+    if model_status == "failed":
+        response.status_code = 503
     return {
-        "status": "healthy",
+        "status": "unhealthy" if model_status == "failed" else "healthy",
+        "model_status": model_status,
         "model_loaded": model is not None,
         "scaler_loaded": scaler is not None,
-        "feature_info_loaded": feature_info is not None
+        "feature_info_loaded": feature_info is not None,
+        "admission": admission.stats(),
+        "capture": capture.stats()
     }
 
+@app.get("/ready")
+async def readiness_check(response: Response):
+    """Readiness check; 200 only once the model is loaded and warmed up"""
+    ready = model_status == "ready"
+    if not ready:
+        response.status_code = 503
+    return {
+        "ready": ready,
+        "model_status": model_status,
+        "error": startup_error,
+        "startup": startup_report,
+        "startup_budget_ms": STARTUP_BUDGET_MS
+    }
+
+def _elapsed_ms(started):
+    return (time.perf_counter() - started) * 1000.0
+
+def _shed():
+    return HTTPException(
+        status_code=503,
+        detail="Inference queue full, retry later",
+        headers={"Retry-After": "1"}
+    )
+
+def _predict_sync(x, profile, single_pass):
+    with profile.stage("inference"), profile.tf_trace():
+        if single_pass:
+            return np.asarray(model.predict_on_batch(x))
+        return model.predict(x, verbose=0)
+
+async def _run_model(x, profile=NULL_PROFILE, single_pass=False):
+    """
+    Run model inference off the event loop and record its latency
+
+    With single_pass, x is scored in one forward pass (instead of Keras'
+    default batches of 32) and its latency is kept out of the per-request
+    estimate that deadline admission relies on.
+    """
+    started = time.perf_counter()
+    predictions = await run_in_threadpool(_predict_sync, x, profile, single_pass)
+    if not single_pass:
+        admission.observe(started)
+    return predictions
+
+async def _finish_profile(profile, response):
+    """Write a captured profile and point the caller at it"""
+    if not profile.enabled:
+        return
+    try:
+        path = await run_in_threadpool(profile.finish)
+        response.headers["X-Profile-Id"] = profile.name
+        logger.info(f"Profile written to {path}: {profile.stages}")
+    except Exception as e:
+        logger.error(f"Failed to write profile {profile.name}: {e}")
+
 @app.post("/predict", response_model=PredictionResponse)
-async def predict(meal: MealRequest):
+async def predict(
+    meal: MealRequest,
+    response: Response,
+    x_request_deadline_ms: Optional[float] = Header(None),
+    x_profile_token: Optional[str] = Header(None)
+):
     """
     Predict nutrient deficiency probabilities for a given meal and user profile
+    
+    An optional X-Request-Deadline-Ms header sets the latency budget. When the
+    queue cannot meet it, a heuristic prediction is returned with degraded=True.
+    A matching X-Profile-Token header (or ML_PROFILE_SAMPLE_RATE) profiles the request.
     """
+    started = time.perf_counter()
     if model is None or scaler is None or feature_info is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
+    capture.record("predict", [meal])
+    decision = admission.decide(x_request_deadline_ms)
+    if decision == SHED:
+        raise _shed()
+    
+    profile = start_profile("predict", x_profile_token)
     try:
-        # Preprocess input
-        x = preprocess_input(meal.dict(), scaler, feature_info)
-        
-        # Make prediction
-        predictions = model.predict(x, verbose=0)
+        # Make prediction, falling back to thresholds if the deadline would be missed
+        source = "heuristic"
+        if decision == FALLBACK:
+            with profile.stage("heuristic"):
+                predictions = heuristic_predict(meal.dict())
+        else:
+            async with admission.queued():
+                if admission.still_in_time(x_request_deadline_ms, _elapsed_ms(started)):
+                    # Preprocess input
+                    with profile.stage("preprocessing"):
+                        x = preprocess_input(meal.dict(), scaler, feature_info)
+                    predictions = await _run_model(x, profile)
+                    admission.complete()
+                    source = "model"
+                else:
+                    with profile.stage("heuristic"):
+                        predictions = heuristic_predict(meal.dict())
         
         # Interpret results
-        interpreted = interpret_predictions(predictions, feature_info)
+        with profile.stage("interpretation"):
+            interpreted = interpret_predictions(predictions, feature_info)
         
         # Generate recommendations
-        suggestions = generate_recommendations(predictions, meal.dict(), feature_info)
+        with profile.stage("recommendations"):
+            suggestions = generate_recommendations(predictions, meal.dict(), feature_info)
         
         # Prepare response
         probabilities = {
@@ -105,8 +303,9 @@ async def predict(meal: MealRequest):
             for label, data in interpreted.items()
         }
         
+        # A heuristic guess never reports more than low confidence
         confidence_scores = {
-            label: data['confidence'] 
+            label: data['confidence'] if source == "model" else "low"
             for label, data in interpreted.items()
         }
         
@@ -114,66 +313,174 @@ async def predict(meal: MealRequest):
             probabilities=probabilities,
             risk_assessment=risk_assessment,
             suggestions=suggestions,
-            confidence_scores=confidence_scores
+            confidence_scores=confidence_scores,
+            prediction_source=source,
+            degraded=source != "model"
         )
         
     except Exception as e:
         logger.error(f"Prediction error: {e}")
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+    finally:
+        await _finish_profile(profile, response)
+
+@app.post("/what-if")
+async def what_if(request: WhatIfRequest):
+    """
+    Sensitivity of each deficiency probability to changing selected nutrients
+    
+    Every nutrient is varied on its own from 0 to its max_change in `steps`
+    increments; the whole grid is scored in one batched forward pass.
+    """
+    if model is None or scaler is None or feature_info is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    unknown = [n for n in request.nutrients if n not in WHAT_IF_DEFAULT_CHANGE]
+    if unknown or not request.nutrients:
+        raise HTTPException(
+            status_code=422,
+            detail=f"nutrients must be a non-empty subset of {list(WHAT_IF_DEFAULT_CHANGE)}, got unknown {unknown}"
+        )
+    unknown = [n for n in (request.max_change or {}) if n not in WHAT_IF_DEFAULT_CHANGE]
+    if unknown:
+        raise HTTPException(
+            status_code=422,
+            detail=f"max_change keys must be in {list(WHAT_IF_DEFAULT_CHANGE)}, got unknown {unknown}"
+        )
+    
+    if admission.decide() == SHED:
+        raise _shed()
+    
+    try:
+        max_change = {**WHAT_IF_DEFAULT_CHANGE, **(request.max_change or {})}
+        deltas = np.stack([
+            np.linspace(0.0, float(max_change[n]), request.steps) for n in request.nutrients
+        ])
+        
+        # Build and score the whole grid at once
+        payload = request.meal.dict()
+        rows, dosha_idx, deltas = build_what_if_grid(payload, request.nutrients, deltas)
+        x = preprocess_rows(rows, dosha_idx, scaler)
+        async with admission.queued():
+            predictions = await _run_model(x, single_pass=True)
+        admission.complete()
+        
+        labels = feature_info['output_labels']
+        baseline = predictions[0]
+        curves = predictions[1:].reshape(len(request.nutrients), request.steps, len(labels))
+        
+        response_curves = {}
+        for i, nutrient in enumerate(request.nutrients):
+            response_curves[nutrient] = {
+                "deltas": deltas[i].tolist(),
+                "probabilities": {
+                    label: curves[i, :, j].tolist() for j, label in enumerate(labels)
+                },
+                "threshold_crossings": {
+                    label: find_threshold_crossings(curves[i, :, j], deltas[i]) for j, label in enumerate(labels)
+                }
+            }
+        
+        return {
+            "baseline": {
+                "probabilities": {label: float(baseline[j]) for j, label in enumerate(labels)},
+                "risk_assessment": {label: get_risk_level(baseline[j]) for j, label in enumerate(labels)}
+            },
+            "curves": response_curves
+        }
+        
+    except Exception as e:
+        logger.error(f"What-if analysis error: {e}")
+        raise HTTPException(status_code=500, detail=f"What-if analysis failed: {str(e)}")
 
 @app.post("/batch-predict")
-async def batch_predict(meals: list[MealRequest]):
+async def batch_predict(
+    meals: list[MealRequest],
+    response: Response,
+    x_request_deadline_ms: Optional[float] = Header(None),
+    x_profile_token: Optional[str] = Header(None)
+):
     """
     Predict nutrient deficiencies for multiple meals
+    
+    The batch is admitted as a unit; once the deadline can no longer be met,
+    remaining meals get heuristic predictions flagged with degraded=True.
     """
+    started = time.perf_counter()
     if model is None or scaler is None or feature_info is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
+    capture.record("batch-predict", meals)
+    decision = admission.decide(x_request_deadline_ms)
+    if decision == SHED:
+        raise _shed()
+    
+    profile = start_profile("batch-predict", x_profile_token)
     try:
         results = []
+        use_model = decision != FALLBACK
         
-        for i, meal in enumerate(meals):
-            try:
-                # Process each meal
-                x = preprocess_input(meal.dict(), scaler, feature_info)
-                predictions = model.predict(x, verbose=0)
-                interpreted = interpret_predictions(predictions, feature_info)
-                suggestions = generate_recommendations(predictions, meal.dict(), feature_info)
+        # The batch holds one queue slot for all of its meals
+        async with admission.queued() if use_model else nullcontext():
+            for i, meal in enumerate(meals):
+                try:
+                    # Process each meal
+                    if use_model:
+                        use_model = admission.still_in_time(x_request_deadline_ms, _elapsed_ms(started))
+                    if use_model:
+                        with profile.stage("preprocessing"):
+                            x = preprocess_input(meal.dict(), scaler, feature_info)
+                        predictions = await _run_model(x, profile)
+                    else:
+                        with profile.stage("heuristic"):
+                            predictions = heuristic_predict(meal.dict())
+                    with profile.stage("interpretation"):
+                        interpreted = interpret_predictions(predictions, feature_info)
+                    with profile.stage("recommendations"):
+                        suggestions = generate_recommendations(predictions, meal.dict(), feature_info)
                 
-                results.append({
-                    "meal_index": i,
-                    "probabilities": {
-                        "iron_def": float(predictions[0][0]),
-                        "vitc_def": float(predictions[0][1]),
-                        "protein_def": float(predictions[0][2])
-                    },
-                    "risk_assessment": {
-                        label: data['risk_level'] 
-                        for label, data in interpreted.items()
-                    },
-                    "suggestions": suggestions,
-                    "status": "success"
-                })
+                    results.append({
+                        "meal_index": i,
+                        "probabilities": {
+                            "iron_def": float(predictions[0][0]),
+                            "vitc_def": float(predictions[0][1]),
+                            "protein_def": float(predictions[0][2])
+                        },
+                        "risk_assessment": {
+                            label: data['risk_level'] 
+                            for label, data in interpreted.items()
+                        },
+                        "suggestions": suggestions,
+                        "prediction_source": "model" if use_model else "heuristic",
+                        "degraded": not use_model,
+                        "status": "success"
+                    })
                 
-            except Exception as e:
-                results.append({
-                    "meal_index": i,
-                    "error": str(e),
-                    "status": "error"
-                })
+                except Exception as e:
+                    results.append({
+                        "meal_index": i,
+                        "error": str(e),
+                        "status": "error"
+                    })
+        
+        if use_model:
+            admission.complete()
         
         return {
             "results": results,
             "summary": {
                 "total": len(meals),
                 "successful": len([r for r in results if r["status"] == "success"]),
-                "failed": len([r for r in results if r["status"] == "error"])
+                "failed": len([r for r in results if r["status"] == "error"]),
+                "degraded": len([r for r in results if r.get("degraded")])
             }
         }
         
     except Exception as e:
         logger.error(f"Batch prediction error: {e}")
         raise HTTPException(status_code=500, detail=f"Batch prediction failed: {str(e)}")
+    finally:
+        await _finish_profile(profile, response)
 
 if __name__ == "__main__":
     import uvicorn
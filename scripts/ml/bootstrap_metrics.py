@@ -0,0 +1,157 @@
+"""
+ml/bootstrap_metrics.py
+Vectorized bootstrap confidence intervals for per-label evaluation metrics
+
+Each resample is drawn as an index vector and turned into per-row
+multiplicities with a bincount. Multiplicity vectors are exchangeable,
+so a batch is read directly in each label's ascending-score order: rank-based
+AUC (Mann-Whitney U, ties counted as 1/2), precision, recall and F1 then come
+out of one cumulative sum and a few matrix-vector products shared by all
+resamples. Every label still gets a valid bootstrap resample, but resamples
+are not paired across labels.
+"""
+
+import multiprocessing
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+METRICS = ("auc", "precision", "recall", "f1")
+
+# Elements of the (n_resamples, n_rows) weight matrix per batch. Batching only
+# amortizes Python overhead (cost is linear in rows), so this mainly bounds
+# the ~3 float64 matrices each worker holds at once. float64 keeps the rank
+# sums exact: float32 loses integers above 2**24.
+_BATCH_ELEMENTS = 4_000_000
+
+# Per-process state set by _init_worker: (list of per-label sort info, n_rows)
+_state = None
+
+def _init_worker(state):
+    global _state
+    _state = state
+
+def _prepare_label(y_true, y_proba, threshold):
+    """
+    Sort one label's rows by score and find groups of tied scores
+
+    Returns:
+        tuple of (positive indicator in ascending-score order as float64,
+        (positions, group starts, group ends) of positive rows whose score is
+        tied with another row, first sorted position predicted positive)
+    """
+    scores = np.asarray(y_proba)
+    order = np.argsort(scores, kind="stable")
+    scores = scores[order]
+    is_pos = (np.asarray(y_true)[order] > 0.5).astype(np.float64)
+    first_pred = int(np.searchsorted(scores, threshold, side="right"))
+
+    # Inclusive start/end position of the tied-score group each row belongs to
+    new_group = np.r_[True, scores[1:] != scores[:-1]]
+    starts = np.flatnonzero(new_group)
+    ends = np.r_[starts[1:], len(scores)] - 1
+    group = np.cumsum(new_group) - 1
+    tied = np.flatnonzero((ends[group] > starts[group]) & (is_pos > 0))
+
+    return is_pos, (tied, starts[group[tied]], ends[group[tied]]), first_pred
+
+def _finish_metrics(u, n_pos, n_total, tp, pred_pos):
+    """Turn per-resample sufficient statistics into an (n_resamples, 4) metric array"""
+    fp = pred_pos - tp
+    fn = n_pos - tp
+    with np.errstate(divide="ignore", invalid="ignore"):
+        auc = u / (n_pos * (n_total - n_pos))
+        # Undefined precision/recall/F1 count as 0, matching sklearn's default
+        precision = np.where(pred_pos > 0, tp / pred_pos, 0.0)
+        recall = np.where(n_pos > 0, tp / n_pos, 0.0)
+        f1 = np.where(2 * tp + fp + fn > 0, 2 * tp / (2 * tp + fp + fn), 0.0)
+    return np.stack([auc, precision, recall, f1], axis=1)
+
+def _bootstrap_batch(task):
+    """Score one batch of resamples for every label"""
+    seed, n_resamples = task
+    labels, n_rows = _state
+    rng = np.random.default_rng(seed)
+
+    # How many times each row appears in each resample
+    weights = np.empty((n_resamples, n_rows))
+    for r in range(n_resamples):
+        weights[r] = np.bincount(rng.integers(0, n_rows, size=n_rows), minlength=n_rows)
+
+    # Each positive row contributes weight * (weight ranked below it + half the
+    # weight tied with it); positive-positive pairs then add up to n_pos^2 / 2
+    cum_weights = np.cumsum(weights, axis=1)
+    rank_terms = np.multiply(weights, -0.5)
+    rank_terms += cum_weights
+    rank_terms *= weights
+    n_total = cum_weights[:, -1]
+
+    out = np.empty((n_resamples, len(labels), len(METRICS)))
+    for j, (is_pos, (tied, tie_starts, tie_ends), first_pred) in enumerate(labels):
+        n_pos = weights @ is_pos
+        u = rank_terms @ is_pos - 0.5 * n_pos * n_pos
+
+        if len(tied):
+            # Tied rows see their whole group as "half below" rather than the rows sorted before them
+            below_group = np.where(tie_starts > 0, cum_weights[:, tie_starts - 1], 0.0)
+            tied_weights = weights[:, tied]
+            row_term = cum_weights[:, tied] - 0.5 * tied_weights
+            group_term = 0.5 * (below_group + cum_weights[:, tie_ends])
+            u += (tied_weights * (group_term - row_term)).sum(axis=1)
+
+        pred_pos = n_total - (cum_weights[:, first_pred - 1] if first_pred > 0 else 0.0)
+        tp = weights[:, first_pred:] @ is_pos[first_pred:]
+
+        out[:, j] = _finish_metrics(u, n_pos, n_total, tp, pred_pos)
+
+    return out
+
+def bootstrap_metrics(y_true, y_proba, n_resamples=1000, threshold=0.5, confidence=0.95, n_jobs=None, seed=0):
+    """
+    Bootstrap confidence intervals for AUC, precision, recall and F1 per label
+
+    Args:
+        y_true: array shaped (n, n_labels) of 0/1 labels
+        y_proba: array shaped (n, n_labels) of predicted probabilities
+        n_resamples: number of bootstrap resamples
+        threshold: probability above which a row is predicted positive
+        confidence: central interval width, e.g. 0.95
+        n_jobs: worker processes, None for os.cpu_count(); 1 runs in-process.
+            Expect roughly 40-110 ms per resample per million rows on one core
+        seed: seed for reproducible resampling
+
+    Returns:
+        list (one per label) of dicts mapping metric -> (low, high)
+    """
+    y_true = np.asarray(y_true).reshape(len(y_true), -1)
+    y_proba = np.asarray(y_proba).reshape(len(y_proba), -1)
+    n_rows = len(y_true)
+
+    state = (
+        [_prepare_label(y_true[:, j], y_proba[:, j], threshold) for j in range(y_true.shape[1])],
+        n_rows
+    )
+
+    batch_size = max(1, _BATCH_ELEMENTS // max(n_rows, 1))
+    sizes = [min(batch_size, n_resamples - start) for start in range(0, n_resamples, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = list(zip(seeds, sizes))
+
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(tasks))
+    if n_jobs <= 1:
+        _init_worker(state)
+        batches = [_bootstrap_batch(task) for task in tasks]
+    else:
+        # Spawn rather than fork: the caller has usually started TensorFlow's threads already
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(state,)) as pool:
+            batches = list(pool.map(_bootstrap_batch, tasks))
+
+    stats = np.concatenate(batches)  # (n_resamples, n_labels, n_metrics)
+    tail = (1.0 - confidence) / 2.0 * 100.0
+    low, high = np.nanpercentile(stats, [tail, 100.0 - tail], axis=0)
+
+    return [
+        {metric: (float(low[j, m]), float(high[j, m])) for m, metric in enumerate(METRICS)}
+        for j in range(y_true.shape[1])
+    ]
@@ -0,0 +1,218 @@
+"""
+ml/capture.py
+Sampled capture of production prediction traffic to a compact binary log
+
+Each log starts with a 16-byte header (magic + record size) followed by
+fixed-size records of CAPTURE_DTYPE, so replay.py can memory-map a log
+straight into a numpy structured array.
+"""
+
+import logging
+import os
+import queue
+import random
+import struct
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_MAGIC = b"NUTRCAP2"
+CAPTURE_HEADER = struct.Struct("<8sII")  # magic, record size, reserved
+ENDPOINTS = {"predict": 0, "batch-predict": 1}
+
+# Raw (unscaled) features are stored so any model version can be replayed
+CAPTURE_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("request_id", "<u4"),
+    ("endpoint", "u1"),
+    ("dosha", "u1"),
+    ("meal_index", "<u4"),
+    ("features", "<f4", (8,))
+])
+
+def read_capture(path):
+    """
+    Memory-map a capture log
+
+    Args:
+        path: path to a .bin log written by TrafficCapture
+
+    Returns:
+        read-only numpy structured array of CAPTURE_DTYPE records
+    """
+    with open(path, "rb") as f:
+        magic, record_size, _ = CAPTURE_HEADER.unpack(f.read(CAPTURE_HEADER.size))
+    if magic != CAPTURE_MAGIC or record_size != CAPTURE_DTYPE.itemsize:
+        raise ValueError(f"{path} is not a compatible capture log")
+
+    n_records = (os.path.getsize(path) - CAPTURE_HEADER.size) // record_size
+    if n_records == 0:
+        return np.empty(0, dtype=CAPTURE_DTYPE)
+    return np.memmap(path, dtype=CAPTURE_DTYPE, mode="r", offset=CAPTURE_HEADER.size, shape=(n_records,))
+
+class TrafficCapture:
+    """
+    Appends a sampled subset of request payloads to rotating capture logs
+
+    Requests are packed on the calling thread and handed to a background
+    writer through a bounded queue; when the writer falls behind, records
+    are dropped rather than slowing down inference.
+    """
+
+    def __init__(self, directory, featurize, sample_rate=0.0, max_bytes=64 * 1024 * 1024, max_files=20, queue_size=10000):
+        """
+        Args:
+            directory: where capture logs are written
+            featurize: callable mapping a request item to (numeric features, dosha index),
+                normally built on model_utils.extract_features
+            sample_rate: fraction of requests to capture; 0 disables capture
+            max_bytes: size at which the current log is rotated
+            max_files: number of logs kept on disk
+            queue_size: records buffered for the writer before dropping
+        """
+        self.directory = directory
+        self.featurize = featurize
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.counters = {"captured": 0, "dropped": 0, "write_errors": 0}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._request_id = 0
+        self._log_seq = 0
+        self._writer = None
+        self._file = None
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0
+
+    def start(self):
+        """Start the background writer thread"""
+        if not self.enabled or self._writer is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._writer = threading.Thread(target=self._write_loop, name="traffic-capture", daemon=True)
+        self._writer.start()
+        logger.info(f"Capturing {self.sample_rate:.2%} of traffic to {self.directory}")
+
+    def record(self, endpoint, payloads):
+        """
+        Sample one request and queue its feature rows for writing
+
+        Never raises for bad payloads: items that featurize rejects are
+        skipped and counted as dropped, so capture cannot fail a request.
+
+        Args:
+            endpoint: "predict" or "batch-predict"
+            payloads: list of meal items from the request, passed to featurize
+        """
+        if self._writer is None or random.random() >= self.sample_rate:
+            return
+
+        self._request_id = (self._request_id + 1) & 0xFFFFFFFF
+        rows = np.zeros(len(payloads), dtype=CAPTURE_DTYPE)
+        rows["timestamp"] = time.time()
+        rows["request_id"] = self._request_id
+        rows["endpoint"] = ENDPOINTS[endpoint]
+        kept = 0
+        for i, payload in enumerate(payloads):
+            try:
+                rows["features"][kept], rows["dosha"][kept] = self.featurize(payload)
+            except Exception:
+                # e.g. a null dosha or gender; the endpoint reports its own error for it
+                continue
+            rows["meal_index"][kept] = i
+            kept += 1
+        self.counters["dropped"] += len(payloads) - kept
+        if kept == 0:
+            return
+
+        try:
+            self._queue.put_nowait(rows[:kept].tobytes())
+            self.counters["captured"] += kept
+        except queue.Full:
+            self.counters["dropped"] += kept
+
+    def close(self):
+        """Flush queued records and stop the writer"""
+        if self._writer is None:
+            return
+        self._queue.put(None)
+        self._writer.join()
+        self._writer = None
+
+    def _open_log(self):
+        self._log_seq += 1
+        name = f"capture-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._log_seq:04d}.bin"
+        path = os.path.join(self.directory, name)
+        self._file = open(path, "wb")
+        self._file.write(CAPTURE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_DTYPE.itemsize, 0))
+        self._rotate()
+
+    def _rotate(self):
+        logs = sorted(
+            (os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".bin")),
+            key=os.path.getmtime
+        )
+        for path in logs[:max(0, len(logs) - self.max_files)]:
+            os.remove(path)
+
+    def _write_chunk(self, chunk):
+        if self._file is None or self._file.tell() + len(chunk) > self.max_bytes:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._open_log()
+        self._file.write(chunk)
+
+    def _close_log(self):
+        """Close the current log, ignoring errors from a log that already failed"""
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def _write_loop(self):
+        failing = False
+        while True:
+            try:
+                chunk = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                chunk = b""
+
+            if chunk is None:
+                break
+
+            try:
+                if chunk:
+                    self._write_chunk(chunk)
+                elif self._file is not None:
+                    self._file.flush()
+                if failing:
+                    logger.info("Traffic capture writes recovered")
+                    failing = False
+            except OSError as e:
+                # Disk full or unwritable: drop this chunk, start a fresh log next time
+                n_rows = len(chunk) // CAPTURE_DTYPE.itemsize
+                self.counters["captured"] -= n_rows
+                self.counters["dropped"] += n_rows
+                self.counters["write_errors"] += 1
+                if not failing:
+                    logger.error(f"Traffic capture write failed, dropping records until it recovers: {e}")
+                    failing = True
+                self._close_log()
+
+        self._close_log()
+
+    def stats(self):
+        """Snapshot of capture counters"""
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "queued": self._queue.qsize(),
+            **self.counters
+        }
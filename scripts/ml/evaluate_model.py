@@ -5,17 +5,14 @@ Evaluate the trained model performance and generate metrics
 
 import os
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.metrics import classification_report, confusion_matrix, roc_auc_score, roc_curve
-from sklearn.model_selection import train_test_split
-import joblib
-import tensorflow as tf
-from model_utils import load_model_and_scaler, preprocess_input
+from model_utils import load_model_and_scaler
+from feature_cache import load_or_build, source_fingerprint
+from bootstrap_metrics import bootstrap_metrics
 
 def load_test_data(csv_path=None):
     """Load test data (same format as training data)"""
+    import pandas as pd
+    
     if csv_path and os.path.exists(csv_path):
         return pd.read_csv(csv_path)
     else:
@@ -64,15 +61,38 @@ def prepare_test_features(df):
     X_numeric = df[feature_cols].values.astype(np.float32)
     
     dosha = df["dosha"].astype(int).values
-    dosha_ohe = tf.keras.utils.to_categorical(dosha, num_classes=3).astype(np.float32)
+    dosha_ohe = np.eye(3, dtype=np.float32)[dosha]
     
     X = np.concatenate([X_numeric, dosha_ohe], axis=1)
     y = df[["iron_def", "vitc_def", "protein_def"]].values.astype(np.float32)
     
     return X, y
 
-def evaluate_model(model, scaler, X_test, y_test, feature_info):
-    """Comprehensive model evaluation"""
+def load_test_features(csv_path=None, use_cache=True):
+    """Load and prepare test features, reusing the feature cache when possible"""
+    def build():
+        test_df = load_test_data(csv_path)
+        print(f"📊 Test data loaded: {len(test_df)} samples")
+        X_test, y_test = prepare_test_features(test_df)
+        return {"X_test": X_test, "y_test": y_test}, None
+    
+    if not use_cache:
+        arrays, _ = build()
+    else:
+        config = {
+            "feature_cols": ["calories", "protein", "carbs", "fat", "iron", "vitaminC", "age", "gender"],
+            "label_cols": ["iron_def", "vitc_def", "protein_def"],
+            "dosha_classes": 3
+        }
+        source = source_fingerprint(csv_path, synthetic_tag="eval-n2000-seed123")
+        arrays, _ = load_or_build("eval", source, config, build)
+    
+    return arrays["X_test"], arrays["y_test"]
+
+def evaluate_model(model, scaler, X_test, y_test, feature_info, n_bootstrap=1000, n_jobs=None):
+    """Comprehensive model evaluation, with bootstrap confidence intervals unless n_bootstrap is 0"""
+    from sklearn.metrics import classification_report, roc_auc_score
+    
     print("🔍 Evaluating model performance...")
     
     # Scale test features
@@ -87,6 +107,12 @@ def evaluate_model(model, scaler, X_test, y_test, feature_info):
     labels = feature_info['output_labels']
     results = {}
     
+    # Confidence intervals for every label from one vectorized bootstrap
+    intervals = [None] * len(labels)
+    if n_bootstrap > 0:
+        print(f"🎲 Bootstrapping {n_bootstrap} resamples...")
+        intervals = bootstrap_metrics(y_test, y_pred_proba, n_resamples=n_bootstrap, n_jobs=n_jobs)
+    
     for i, label in enumerate(labels):
         print(f"\n📊 {label.upper()} DEFICIENCY METRICS:")
         print("=" * 40)
@@ -98,11 +124,15 @@ def evaluate_model(model, scaler, X_test, y_test, feature_info):
         # AUC Score
         auc = roc_auc_score(y_test[:, i], y_pred_proba[:, i])
         print(f"AUC Score: {auc:.4f}")
+        if intervals[i] is not None:
+            for metric, (low, high) in intervals[i].items():
+                print(f"{metric.upper()} 95% CI: [{low:.4f}, {high:.4f}]")
         
         # Store results
         results[label] = {
             'classification_report': report,
             'auc_score': auc,
+            'confidence_intervals': intervals[i],
             'y_true': y_test[:, i],
             'y_pred': y_pred[:, i],
             'y_pred_proba': y_pred_proba[:, i]
@@ -112,6 +142,10 @@ def evaluate_model(model, scaler, X_test, y_test, feature_info):
 
 def plot_evaluation_metrics(results, save_path="model_evaluation.png"):
     """Create visualization of model performance"""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from sklearn.metrics import confusion_matrix, roc_curve
+    
     fig, axes = plt.subplots(2, 3, figsize=(15, 10))
     fig.suptitle('Model Performance Evaluation', fontsize=16)
     
@@ -169,7 +203,14 @@ def generate_evaluation_report(results, save_path="evaluation_report.txt"):
             f.write(f"Precision: {report['1']['precision']:.4f}\n")
             f.write(f"Recall: {report['1']['recall']:.4f}\n")
             f.write(f"F1-Score: {report['1']['f1-score']:.4f}\n")
-            f.write(f"Support: {report['1']['support']}\n\n")
+            f.write(f"Support: {report['1']['support']}\n")
+            
+            intervals = results[label]['confidence_intervals']
+            if intervals is not None:
+                f.write("95% bootstrap confidence intervals:\n")
+                for metric, (low, high) in intervals.items():
+                    f.write(f"  {metric.upper()}: [{low:.4f}, {high:.4f}]\n")
+            f.write("\n")
         
         # Recommendations
         f.write("RECOMMENDATIONS\n")
@@ -186,7 +227,7 @@ def generate_evaluation_report(results, save_path="evaluation_report.txt"):
     
     print(f"📄 Evaluation report saved to: {save_path}")
 
-def main(test_csv_path=None):
+def main(test_csv_path=None, use_cache=True, n_bootstrap=1000, n_jobs=None):
     """Main evaluation function"""
     print("🚀 Starting model evaluation...")
     
@@ -195,16 +236,12 @@ def main(test_csv_path=None):
         model, scaler, feature_info = load_model_and_scaler()
         print("✅ Model loaded successfully")
         
-        # Load test data
-        test_df = load_test_data(test_csv_path)
-        print(f"📊 Test data loaded: {len(test_df)} samples")
-        
-        # Prepare test features
-        X_test, y_test = prepare_test_features(test_df)
-        print("🔧 Test features prepared")
+        # Load and prepare test data (cached across runs on the same dataset)
+        X_test, y_test = load_test_features(test_csv_path, use_cache)
+        print(f"🔧 Test features prepared: {X_test.shape[0]} samples")
         
         # Evaluate model
-        results = evaluate_model(model, scaler, X_test, y_test, feature_info)
+        results = evaluate_model(model, scaler, X_test, y_test, feature_info, n_bootstrap, n_jobs)
         
         # Generate visualizations
         plot_evaluation_metrics(results)
@@ -222,6 +259,11 @@ if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description='Evaluate trained model')
     parser.add_argument("--test-csv", help="Path to test dataset CSV", default=None)
+    parser.add_argument("--no-cache", action="store_true", help="Rebuild features instead of using the feature cache")
+    parser.add_argument("--bootstrap", type=int, help="Bootstrap resamples for confidence intervals (0 disables)", default=1000)
+    parser.add_argument("--n-jobs", type=int, default=None,
+                        help="Worker processes for bootstrapping (default: all CPUs); each resample costs "
+                             "roughly 40-110 ms per million test rows on one core")
     args = parser.parse_args()
     
-    main(args.test_csv)
+    main(args.test_csv, use_cache=not args.no_cache, n_bootstrap=args.bootstrap, n_jobs=args.n_jobs)
@@ -0,0 +1,135 @@
+"""
+ml/feature_cache.py
+On-disk cache of prepared feature matrices for training and evaluation runs
+
+Entries are keyed by a content hash of the source data plus the
+preprocessing config, and hold float32 .npy arrays (loaded memory-mapped)
+and optionally the fitted scaler.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+CACHE_DIR = os.environ.get("ML_FEATURE_CACHE_DIR", os.path.join(os.path.dirname(__file__), "feature_cache"))
+# Bump when the on-disk layout or preprocessing code changes. Synthetic data is
+# keyed only by its tag (e.g. "train-n10000-seed42"), so edits to the generators
+# (train.load_dataset, evaluate_model.load_test_data) or to prepare_features /
+# prepare_test_features also need a bump, or stale matrices are served.
+CACHE_VERSION = 1
+
+def hash_file(path, chunk_size=8 * 1024 * 1024, memo_dir=CACHE_DIR):
+    """
+    Content hash of a (possibly multi-GB) file, read in chunks
+
+    The digest is memoised in a sidecar under memo_dir keyed on the file's
+    (path, st_size, st_mtime_ns), so an unchanged file is only read once.
+    Pass memo_dir=None to always re-read.
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    key = {"path": path, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    memo_path = None
+    if memo_dir:
+        name = hashlib.blake2b(path.encode(), digest_size=16).hexdigest()
+        memo_path = os.path.join(memo_dir, "hashes", f"{name}.json")
+        try:
+            with open(memo_path) as f:
+                memo = json.load(f)
+            if {k: memo.get(k) for k in key} == key:
+                return memo["digest"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    digest = digest.hexdigest()
+
+    if memo_path:
+        try:
+            os.makedirs(os.path.dirname(memo_path), exist_ok=True)
+            tmp = f"{memo_path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump({**key, "digest": digest}, f)
+            os.replace(tmp, memo_path)
+        except OSError:
+            pass  # memo is only an optimisation; the cache still works without it
+    return digest
+
+def source_fingerprint(csv_path, synthetic_tag, cache_dir=CACHE_DIR):
+    """
+    Identify the data a run will load
+
+    Args:
+        csv_path: dataset CSV, used when it exists
+        synthetic_tag: stable name for the synthetic generator used otherwise
+        cache_dir: cache root, also where the CSV hash is memoised
+
+    Returns:
+        "csv:<content hash>" or "synthetic:<tag>"
+    """
+    if csv_path and os.path.exists(csv_path):
+        return f"csv:{hash_file(csv_path, memo_dir=cache_dir)}"
+    return f"synthetic:{synthetic_tag}"
+
+def cache_key(source, config):
+    """Hash of the data fingerprint and preprocessing config"""
+    blob = json.dumps({"version": CACHE_VERSION, "source": source, "config": config}, sort_keys=True)
+    return hashlib.blake2b(blob.encode(), digest_size=16).hexdigest()
+
+def load_or_build(name, source, config, build, cache_dir=CACHE_DIR):
+    """
+    Return cached arrays for (source, config), building and storing them on a miss
+
+    Args:
+        name: short entry name, e.g. "train" or "eval"
+        source: fingerprint from source_fingerprint()
+        config: JSON-serializable preprocessing config
+        build: callable returning (dict of name -> array, fitted scaler or None)
+        cache_dir: cache root directory
+
+    Returns:
+        tuple of (dict of name -> float32 array, scaler or None); cached
+        arrays are read-only memory maps
+    """
+    entry = os.path.join(cache_dir, f"{name}-{cache_key(source, config)}")
+
+    if os.path.isdir(entry):
+        arrays = {
+            filename[:-len(".npy")]: np.load(os.path.join(entry, filename), mmap_mode="r")
+            for filename in os.listdir(entry) if filename.endswith(".npy")
+        }
+        scaler_path = os.path.join(entry, "scaler.joblib")
+        scaler = None
+        if os.path.exists(scaler_path):
+            import joblib
+            scaler = joblib.load(scaler_path)
+        print(f"⚡ Loaded cached features from {entry}")
+        return arrays, scaler
+
+    arrays, scaler = build()
+    arrays = {key: np.ascontiguousarray(value, dtype=np.float32) for key, value in arrays.items()}
+
+    # Write into a temporary directory and rename so readers never see a partial entry
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=f".{name}-", dir=cache_dir)
+    try:
+        for key, value in arrays.items():
+            np.save(os.path.join(tmp, f"{key}.npy"), value)
+        if scaler is not None:
+            import joblib
+            joblib.dump(scaler, os.path.join(tmp, "scaler.joblib"))
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({"version": CACHE_VERSION, "source": source, "config": config}, f, indent=2)
+        os.rename(tmp, entry)
+        print(f"💾 Cached features to {entry}")
+    except OSError:
+        # Another run stored the same entry first, or the cache is not writable
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return arrays, scaler
@@ -4,37 +4,39 @@ Helper functions for model preprocessing and inference
 """
 
 import os
+import math
 import numpy as np
-import joblib
-import tensorflow as tf
 
 MODEL_DIR = os.path.join(os.path.dirname(__file__), "model_saved")
 SCALER_PATH = os.path.join(MODEL_DIR, "scaler.joblib")
 FEATURE_INFO_PATH = os.path.join(MODEL_DIR, "feature_info.joblib")
 
-def load_model_and_scaler():
+NUMERIC_FEATURES = ["calories", "protein", "carbs", "fat", "iron", "vitaminC", "age", "gender"]
+RISK_THRESHOLDS = (0.3, 0.6)  # boundaries between low / moderate / high risk
+
+def load_model_and_scaler(model_dir=MODEL_DIR):
     """Load the trained model, scaler, and feature info"""
+    # Imported here so importing this module stays cheap
+    import joblib
+    import tensorflow as tf
+    
     try:
-        model = tf.keras.models.load_model(MODEL_DIR)
-        scaler = joblib.load(SCALER_PATH)
-        feature_info = joblib.load(FEATURE_INFO_PATH)
+        model = tf.keras.models.load_model(model_dir)
+        scaler = joblib.load(os.path.join(model_dir, "scaler.joblib"))
+        feature_info = joblib.load(os.path.join(model_dir, "feature_info.joblib"))
         return model, scaler, feature_info
     except Exception as e:
         raise RuntimeError(f"Failed to load model components: {e}")
 
-def preprocess_input(payload, scaler, feature_info):
+def extract_features(payload):
     """
-    Preprocess input payload for model prediction
+    Pull the raw (unscaled) model features out of a request payload
     
     Args:
-        payload: dict with keys:
-            calories, protein, carbs, fat, iron, vitaminC, age, gender (0/1), 
-            dosha (one of 'VATA','PITTA','KAPHA' OR 0/1/2)
-        scaler: fitted StandardScaler
-        feature_info: feature information dict
+        payload: dict in the format accepted by preprocess_input
     
     Returns:
-        numpy array shaped (1, input_dim) ready for model prediction
+        tuple of (list of 8 numeric features, dosha index 0/1/2)
     """
     # Handle dosha input
     dosha_map = {"VATA": 0, "PITTA": 1, "KAPHA": 2}
@@ -45,10 +47,6 @@ def preprocess_input(payload, scaler, feature_info):
     else:
         dosha_idx = int(dosha)
     
-    # Create one-hot encoding for dosha
-    dosha_ohe = [0, 0, 0]
-    dosha_ohe[dosha_idx] = 1
-    
     # Extract numeric features in correct order
     numeric_features = [
         float(payload.get("calories", 0.0)),
@@ -61,17 +59,124 @@ def preprocess_input(payload, scaler, feature_info):
         float(payload.get("gender", 0))
     ]
     
-    # Convert to numpy array and scale
-    x_numeric = np.array(numeric_features, dtype=np.float32).reshape(1, -1)
+    return numeric_features, dosha_idx
+
+def preprocess_rows(x_numeric, dosha_idx, scaler):
+    """
+    Scale raw numeric features and append the dosha one-hot encoding
+    
+    Args:
+        x_numeric: array-like of shape (n, 8) with unscaled numeric features
+        dosha_idx: array-like of shape (n,) with dosha indices 0/1/2
+        scaler: fitted StandardScaler
+    
+    Returns:
+        numpy array shaped (n, input_dim) ready for model prediction
+    """
+    x_numeric = np.asarray(x_numeric, dtype=np.float32).reshape(-1, 8)
     x_numeric_scaled = scaler.transform(x_numeric)
     
     # Combine scaled numeric features with dosha one-hot encoding
-    x_full = np.concatenate([
-        x_numeric_scaled, 
-        np.array(dosha_ohe, dtype=np.float32).reshape(1, -1)
-    ], axis=1)
+    dosha_ohe = np.eye(3, dtype=np.float32)[np.asarray(dosha_idx, dtype=np.intp).reshape(-1)]
+    return np.concatenate([x_numeric_scaled, dosha_ohe], axis=1)
+
+def preprocess_input(payload, scaler, feature_info):
+    """
+    Preprocess input payload for model prediction
+    
+    Args:
+        payload: dict with keys:
+            calories, protein, carbs, fat, iron, vitaminC, age, gender (0/1), 
+            dosha (one of 'VATA','PITTA','KAPHA' OR 0/1/2)
+        scaler: fitted StandardScaler
+        feature_info: feature information dict
+    
+    Returns:
+        numpy array shaped (1, input_dim) ready for model prediction
+    """
+    numeric_features, dosha_idx = extract_features(payload)
+    return preprocess_rows([numeric_features], [dosha_idx], scaler)
+
+def build_what_if_grid(payload, nutrients, deltas):
+    """
+    Build raw feature rows that vary one nutrient at a time
+    
+    Args:
+        payload: dict in the format accepted by preprocess_input
+        nutrients: names from NUMERIC_FEATURES to vary
+        deltas: array shaped (len(nutrients), steps) of amounts added to each nutrient
+    
+    Returns:
+        tuple of (numeric rows shaped (1 + len(nutrients) * steps, 8), dosha indices,
+        effective deltas); row 0 is the unmodified meal, followed by each nutrient's
+        rows in order. Nutrients are clamped at 0, so effective deltas never go
+        below -base value.
+    """
+    numeric_features, dosha_idx = extract_features(payload)
+    base = np.asarray(numeric_features, dtype=np.float32)
+    deltas = np.array(deltas, dtype=np.float64)
+    
+    grid = np.tile(base, (len(nutrients), deltas.shape[1], 1))
+    for i, nutrient in enumerate(nutrients):
+        col = NUMERIC_FEATURES.index(nutrient)
+        deltas[i] = np.maximum(deltas[i], -base[col])
+        grid[i, :, col] = base[col] + deltas[i]
+    
+    rows = np.concatenate([base.reshape(1, -1), grid.reshape(-1, base.size)])
+    return rows, np.full(len(rows), dosha_idx), deltas
+
+def find_threshold_crossings(curve, deltas, thresholds=RISK_THRESHOLDS):
+    """
+    Find the smallest change that moves a probability across each risk threshold
+    
+    Args:
+        curve: probabilities shaped (steps,) ordered by increasing |delta|, starting at delta 0
+        deltas: amounts matching curve
+        thresholds: risk level boundaries to test
+    
+    Returns:
+        dict mapping each threshold to the first delta that crosses it, or None
+    """
+    above = np.asarray(curve)[:, None] >= np.asarray(thresholds)
+    crossed = above != above[0]
+    first = crossed.argmax(axis=0)
+    return {
+        str(threshold): float(deltas[first[j]]) if crossed[first[j], j] else None
+        for j, threshold in enumerate(thresholds)
+    }
+
+# Deficiency thresholds used for the fast heuristic fallback, as
+# (feature, female threshold, male threshold, spread) per label. They mirror the rules the synthetic
+# training labels are generated from in train.py.
+HEURISTIC_THRESHOLDS = {
+    "iron_def": ("iron", 15.0, 10.0, 2.0),
+    "vitc_def": ("vitaminC", 30.0, 30.0, 5.0),
+    "protein_def": ("protein", 46.0, 56.0, 5.0),
+}
+
+def heuristic_predict(payload):
+    """
+    Estimate deficiency probabilities from nutrient thresholds alone
+    
+    Used when the model cannot answer in time. Each probability is a logistic
+    approximation of the chance the nutrient falls below its threshold.
+    
+    Args:
+        payload: dict in the same format accepted by preprocess_input
+    
+    Returns:
+        numpy array of shape (1, 3) laid out like model.predict output
+    """
+    gender = int(payload.get("gender") or 0)
+    probs = []
+    
+    for key, female_threshold, male_threshold, spread in HEURISTIC_THRESHOLDS.values():
+        value = float(payload.get(key) or 0.0)
+        threshold = male_threshold if gender == 1 else female_threshold
+        z = max(-50.0, min(50.0, 1.702 * (value - threshold) / spread))
+        probs.append(1.0 / (1.0 + math.exp(z)))
     
-    return x_full
+    return np.array([probs], dtype=np.float32)
 
 def interpret_predictions(predictions, feature_info):
     """
@@ -101,9 +206,9 @@ def interpret_predictions(predictions, feature_info):
 
 def get_risk_level(probability):
     """Convert probability to risk level"""
-    if probability < 0.3:
+    if probability < RISK_THRESHOLDS[0]:
         return "low"
-    elif probability < 0.6:
+    elif probability < RISK_THRESHOLDS[1]:
         return "moderate"
     else:
         return "high"
@@ -0,0 +1,210 @@
+"""
+ml/profiling.py
+Opt-in per-request profiling with collapsed-stack and speedscope output
+"""
+
+import hmac
+import json
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+PROFILE_DIR = os.environ.get("ML_PROFILE_DIR", os.path.join(os.path.dirname(__file__), "profiles"))
+PROFILE_TOKEN = os.environ.get("ML_PROFILE_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.environ.get("ML_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_FORMAT = os.environ.get("ML_PROFILE_FORMAT", "speedscope")  # "speedscope" or "collapsed"
+PROFILE_INTERVAL_MS = float(os.environ.get("ML_PROFILE_INTERVAL_MS", "1"))
+PROFILE_MAX_FILES = int(os.environ.get("ML_PROFILE_MAX_FILES", "50"))
+PROFILE_TF_TRACE = os.environ.get("ML_PROFILE_TF_TRACE", "0") == "1"
+
+# Only one TensorFlow profiler session may run per process
+_tf_trace_lock = threading.Lock()
+_NULL_CONTEXT = nullcontext()
+
+class NullProfile:
+    """Stand-in used for unprofiled requests; every hook is a no-op"""
+
+    enabled = False
+    name = None
+    stages = {}
+
+    def stage(self, name):
+        return _NULL_CONTEXT
+
+    def tf_trace(self):
+        return _NULL_CONTEXT
+
+    def finish(self):
+        return None
+
+NULL_PROFILE = NullProfile()
+
+class RequestProfile:
+    """
+    Sampling profiler scoped to a single request
+
+    A background thread samples the stacks of threads currently inside a
+    stage() block, so time spent by other requests on the same threads
+    between stages is not attributed to this one.
+    """
+
+    enabled = True
+
+    def __init__(self, name, interval_ms=PROFILE_INTERVAL_MS, trace_tf=PROFILE_TF_TRACE):
+        self.name = name
+        self.interval_ms = interval_ms
+        self.trace_tf = trace_tf
+        self.stages = {}
+        self.samples = Counter()
+        self._active = {}
+        self._stop = threading.Event()
+        self._started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._sample_loop, name=f"profiler-{name}", daemon=True)
+        self._sampler.start()
+
+    @contextmanager
+    def stage(self, name):
+        """Attribute samples and wall time on the current thread to a named stage"""
+        ident = threading.get_ident()
+        self._active[ident] = name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._active.pop(ident, None)
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed_ms
+
+    @contextmanager
+    def tf_trace(self):
+        """Capture a TensorFlow profiler trace if enabled and no other trace is running"""
+        if not self.trace_tf or not _tf_trace_lock.acquire(blocking=False):
+            yield
+            return
+
+        import tensorflow as tf
+        started = False
+        try:
+            tf.profiler.experimental.start(os.path.join(PROFILE_DIR, "tf", self.name))
+            started = True
+            yield
+        finally:
+            if started:
+                tf.profiler.experimental.stop()
+            _tf_trace_lock.release()
+
+    def _sample_loop(self):
+        interval = self.interval_ms / 1000.0
+        while not self._stop.wait(interval):
+            frames = sys._current_frames()
+            for ident, stage in list(self._active.items()):
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(f"stage:{stage}")
+                stack.reverse()
+                self.samples[tuple(stack)] += 1
+
+    def finish(self):
+        """Stop sampling, write the profile to PROFILE_DIR and return its path"""
+        self._stop.set()
+        self._sampler.join()
+        duration_ms = (time.perf_counter() - self._started) * 1000.0
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        if PROFILE_FORMAT == "collapsed":
+            path = os.path.join(PROFILE_DIR, f"{self.name}.collapsed.txt")
+            with open(path, "w") as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{';'.join(stack)} {count}\n")
+        else:
+            path = os.path.join(PROFILE_DIR, f"{self.name}.speedscope.json")
+            with open(path, "w") as f:
+                json.dump(self._to_speedscope(duration_ms), f)
+
+        rotate_profiles()
+        return path
+
+    def _to_speedscope(self, duration_ms):
+        frame_index = {}
+        samples = []
+        weights = []
+        for stack, count in self.samples.items():
+            samples.append([frame_index.setdefault(name, len(frame_index)) for name in stack])
+            weights.append(count * self.interval_ms)
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "ai-nutrient-analyzer-ml",
+            "shared": {"frames": [{"name": name} for name in frame_index]},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": duration_ms,
+                "samples": samples,
+                "weights": weights
+            }],
+            "stages_ms": {name: round(ms, 3) for name, ms in self.stages.items()}
+        }
+
+def start_profile(endpoint, token=None):
+    """
+    Decide whether to profile a request
+
+    Args:
+        endpoint: short endpoint name used in the profile file name
+        token: value of the X-Profile-Token header, if any
+
+    Returns:
+        a RequestProfile when the admin token matches or the request is
+        sampled, otherwise NULL_PROFILE
+    """
+    # An unset or empty ML_PROFILE_TOKEN never matches. Headers are decoded as
+    # latin-1 and compare_digest rejects non-ASCII str, so compare bytes
+    forced = (
+        bool(PROFILE_TOKEN) and token is not None
+        and hmac.compare_digest(token.encode("latin-1", "replace"), PROFILE_TOKEN.encode())
+    )
+    if not forced and (PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE):
+        return NULL_PROFILE
+
+    name = f"{endpoint}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    return RequestProfile(name)
+
+def rotate_profiles(max_files=PROFILE_MAX_FILES):
+    """Delete the oldest profiles and TensorFlow traces beyond max_files"""
+    for directory in (PROFILE_DIR, os.path.join(PROFILE_DIR, "tf")):
+        if not os.path.isdir(directory):
+            continue
+        entries = []
+        for entry in os.listdir(directory):
+            if entry == "tf":
+                continue
+            path = os.path.join(directory, entry)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                pass  # already rotated by a concurrent request
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - max_files)]:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass  # already rotated by a concurrent request
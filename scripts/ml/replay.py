@@ -0,0 +1,204 @@
+"""
+ml/replay.py
+Replay captured production traffic against a model version at full speed
+
+Reads capture logs written by the inference server (see capture.py) through
+memory mapping, runs them through the Keras model or a TFLite conversion of
+it, and reports latency distributions. With --baseline-model-dir the same
+traffic is also scored by a second model and prediction diffs are reported.
+"""
+
+import glob
+import json
+import time
+import numpy as np
+from model_utils import MODEL_DIR, RISK_THRESHOLDS, load_model_and_scaler, preprocess_rows
+from capture import read_capture
+
+class KerasEngine:
+    """Score batches with the Keras model directly"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def prepare(self, shape):
+        pass
+
+    def predict(self, x):
+        return np.asarray(self.model.predict_on_batch(x))
+
+class TFLiteEngine:
+    """Score batches with a TFLite conversion of the Keras model"""
+
+    def __init__(self, model):
+        import tensorflow as tf
+        
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        self.interpreter = tf.lite.Interpreter(model_content=converter.convert())
+        self._input = self.interpreter.get_input_details()[0]["index"]
+        self._output = self.interpreter.get_output_details()[0]["index"]
+        self._batch_size = None
+
+    def prepare(self, shape):
+        """Resize the interpreter's input for a new batch size (untimed in replay)"""
+        if shape[0] != self._batch_size:
+            self.interpreter.resize_tensor_input(self._input, shape)
+            self.interpreter.allocate_tensors()
+            self._batch_size = shape[0]
+
+    def predict(self, x):
+        self.prepare(x.shape)
+        self.interpreter.set_tensor(self._input, np.ascontiguousarray(x, dtype=np.float32))
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self._output).copy()
+
+ENGINES = {"keras": KerasEngine, "tflite": TFLiteEngine}
+
+def load_engine(engine_name, model_dir):
+    """Load a model version and wrap it in the requested engine"""
+    model, scaler, feature_info = load_model_and_scaler(model_dir)
+    return ENGINES[engine_name](model), scaler, feature_info
+
+def replay(log_paths, engine, scaler, batch_size=256, warmup_batches=3):
+    """
+    Score every captured row, timing each batch
+
+    Args:
+        log_paths: capture log files, replayed in order
+        engine: object with prepare(shape) and predict(x) methods
+        scaler: scaler fitted for the model version being replayed
+        batch_size: rows per forward pass
+        warmup_batches: batches scored before timing starts
+
+    Returns:
+        tuple of (predictions array shaped (n, 3), per-batch latencies in ms,
+        total wall time in seconds)
+    """
+    predictions = []
+    latencies_ms = []
+    warmed_up = 0
+    started = time.perf_counter()
+
+    for path in log_paths:
+        records = read_capture(path)
+        for start in range(0, len(records), batch_size):
+            chunk = records[start:start + batch_size]
+            x = preprocess_rows(chunk["features"], chunk["dosha"], scaler)
+
+            if warmed_up < warmup_batches:
+                engine.predict(x)
+                warmed_up += 1
+
+            # Re-allocation for a new batch shape is setup cost, not inference latency
+            engine.prepare(x.shape)
+
+            batch_started = time.perf_counter()
+            predictions.append(engine.predict(x))
+            latencies_ms.append((time.perf_counter() - batch_started) * 1000.0)
+
+    total_s = time.perf_counter() - started
+    if not predictions:
+        return np.empty((0, 3), dtype=np.float32), np.empty(0), total_s
+    return np.concatenate(predictions), np.asarray(latencies_ms), total_s
+
+def summarize_latency(latencies_ms, n_rows, total_s):
+    """Latency percentiles per batch and overall throughput"""
+    if len(latencies_ms) == 0:
+        return {"rows": 0, "batches": 0}
+    p50, p90, p99 = np.percentile(latencies_ms, [50, 90, 99])
+    return {
+        "rows": int(n_rows),
+        "batches": int(len(latencies_ms)),
+        "rows_per_second": float(n_rows / total_s) if total_s > 0 else None,
+        "batch_latency_ms": {
+            "mean": float(latencies_ms.mean()),
+            "p50": float(p50),
+            "p90": float(p90),
+            "p99": float(p99),
+            "max": float(latencies_ms.max())
+        }
+    }
+
+def diff_predictions(candidate, baseline, labels):
+    """
+    Compare two sets of predictions over the same traffic
+
+    Returns:
+        dict per label with mean/max absolute probability difference and the
+        fraction of rows whose get_risk_level bucket changed
+    """
+    abs_diff = np.abs(candidate - baseline)
+    risk_changed = np.digitize(candidate, RISK_THRESHOLDS) != np.digitize(baseline, RISK_THRESHOLDS)
+    return {
+        label: {
+            "mean_abs_diff": float(abs_diff[:, i].mean()),
+            "max_abs_diff": float(abs_diff[:, i].max()),
+            "risk_level_changed": float(risk_changed[:, i].mean())
+        }
+        for i, label in enumerate(labels)
+    }
+
+def print_latency(name, summary):
+    print(f"\n⏱️  {name}")
+    print("-" * 40)
+    if not summary["rows"]:
+        print("No rows replayed")
+        return
+    lat = summary["batch_latency_ms"]
+    print(f"Rows: {summary['rows']} in {summary['batches']} batches")
+    print(f"Throughput: {summary['rows_per_second']:.0f} rows/s")
+    print(f"Batch latency (ms): p50 {lat['p50']:.3f}  p90 {lat['p90']:.3f}  p99 {lat['p99']:.3f}  max {lat['max']:.3f}")
+
+def main(logs, model_dir=MODEL_DIR, engine="keras", baseline_model_dir=None, baseline_engine=None,
+         batch_size=256, json_path=None):
+    """Main replay function"""
+    log_paths = sorted(path for pattern in logs for path in glob.glob(pattern))
+    if not log_paths:
+        raise SystemExit("❌ No capture logs matched")
+    print(f"🔁 Replaying {len(log_paths)} capture log(s)")
+
+    candidate_engine, scaler, feature_info = load_engine(engine, model_dir)
+    candidate, latencies, total_s = replay(log_paths, candidate_engine, scaler, batch_size)
+    report = {"candidate": {"model_dir": model_dir, "engine": engine, **summarize_latency(latencies, len(candidate), total_s)}}
+    print_latency(f"{model_dir} ({engine})", report["candidate"])
+
+    if baseline_model_dir:
+        baseline_engine = baseline_engine or engine
+        base_engine, base_scaler, _ = load_engine(baseline_engine, baseline_model_dir)
+        baseline, latencies, total_s = replay(log_paths, base_engine, base_scaler, batch_size)
+        report["baseline"] = {
+            "model_dir": baseline_model_dir,
+            "engine": baseline_engine,
+            **summarize_latency(latencies, len(baseline), total_s)
+        }
+        print_latency(f"{baseline_model_dir} ({baseline_engine})", report["baseline"])
+
+        if len(candidate):
+            report["diff"] = diff_predictions(candidate, baseline, feature_info['output_labels'])
+            print("\n📊 PREDICTION DIFF (candidate vs baseline)")
+            print("=" * 40)
+            for label, d in report["diff"].items():
+                print(f"{label}: mean |Δp| {d['mean_abs_diff']:.4f}, max |Δp| {d['max_abs_diff']:.4f}, "
+                      f"risk level changed {d['risk_level_changed']:.2%}")
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📄 Replay report saved to: {json_path}")
+
+    return report
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Replay captured traffic against a model version')
+    parser.add_argument("logs", nargs="+", help="Capture log files or glob patterns")
+    parser.add_argument("--model-dir", help="Model version to replay", default=MODEL_DIR)
+    parser.add_argument("--engine", choices=sorted(ENGINES), help="Inference engine", default="keras")
+    parser.add_argument("--baseline-model-dir", help="Model version to diff predictions against", default=None)
+    parser.add_argument("--baseline-engine", choices=sorted(ENGINES), help="Engine for the baseline (defaults to --engine)", default=None)
+    parser.add_argument("--batch-size", type=int, help="Rows per forward pass", default=256)
+    parser.add_argument("--json", help="Write the report as JSON to this path", default=None)
+    args = parser.parse_args()
+
+    main(args.logs, args.model_dir, args.engine, args.baseline_model_dir, args.baseline_engine,
+         args.batch_size, args.json)
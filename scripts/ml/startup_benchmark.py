@@ -0,0 +1,111 @@
+"""
+ml/startup_benchmark.py
+Measure cold-start time of the CLIs and the inference service against budgets
+
+CLI timings cover `python <script> --help`. Service timings cover the time
+from launching uvicorn the way the Dockerfile does (`app:app` from this
+directory) until /health and /ready first return 200; the per-stage
+breakdown (imports, dependency imports, artifact load, warmup) is read
+from /ready.
+Exits non-zero when any measurement is over its budget.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+CLI_SCRIPTS = ["train.py", "evaluate_model.py", "replay.py"]
+APP_TARGET = "app:app"  # matches the Dockerfile's CMD, run from its WORKDIR (this directory)
+
+def time_cli(script, repeat=3):
+    """Median wall time in ms of `python <script> --help`"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, script, "--help"], cwd=ML_DIR, check=True, stdout=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - started) * 1000.0)
+    return statistics.median(timings)
+
+def _wait_for(url, started, timeout_s):
+    """Poll url until it returns 200; return (elapsed ms, parsed body) or (None, None) on timeout"""
+    while time.perf_counter() - started < timeout_s:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                return (time.perf_counter() - started) * 1000.0, json.loads(response.read())
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.05)
+    return None, None
+
+def time_service(app_target=APP_TARGET, port=8765, timeout_s=120):
+    """
+    Launch the service and time how long it takes to become live and ready
+
+    Returns:
+        dict with health_ms, ready_ms (None if never reached) and the
+        service's own startup stage report
+    """
+    command = [sys.executable, "-m", "uvicorn", app_target, "--host", "127.0.0.1", "--port", str(port)]
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=ML_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        health_ms, _ = _wait_for(f"http://127.0.0.1:{port}/health", started, timeout_s)
+        ready_ms, ready = _wait_for(f"http://127.0.0.1:{port}/ready", started, timeout_s)
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        "health_ms": health_ms,
+        "ready_ms": ready_ms,
+        "stages": (ready or {}).get("startup", {})
+    }
+
+def check(name, value_ms, budget_ms):
+    """Print one measurement and return whether it is within budget"""
+    ok = value_ms is not None and value_ms <= budget_ms
+    shown = "timeout" if value_ms is None else f"{value_ms:.0f} ms"
+    print(f"{'✅' if ok else '❌'} {name:<24} {shown:>10}  (budget {budget_ms:.0f} ms)")
+    return ok
+
+def main(cli_budget_ms=1500, health_budget_ms=3000, ready_budget_ms=15000, repeat=3,
+         skip_service=False, app_target=APP_TARGET, port=8765):
+    """Main benchmark function"""
+    print("🚀 Measuring startup times...")
+    results = []
+
+    for script in CLI_SCRIPTS:
+        results.append(check(f"{script} --help", time_cli(script, repeat), cli_budget_ms))
+
+    if not skip_service:
+        service = time_service(app_target, port, timeout_s=max(ready_budget_ms / 1000.0 * 2, 30))
+        results.append(check("service /health", service["health_ms"], health_budget_ms))
+        results.append(check("service /ready", service["ready_ms"], ready_budget_ms))
+        for stage, ms in service["stages"].items():
+            print(f"   {stage:<22} {ms:>10.0f} ms")
+
+    if not all(results):
+        print("❌ Startup is over budget")
+        sys.exit(1)
+    print("✅ Startup is within budget")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark CLI and service startup time')
+    parser.add_argument("--cli-budget-ms", type=float, help="Budget for each CLI --help", default=1500)
+    parser.add_argument("--health-budget-ms", type=float, help="Budget until /health answers", default=3000)
+    parser.add_argument("--ready-budget-ms", type=float, help="Budget until /ready answers",
+                        default=float(os.environ.get("ML_STARTUP_BUDGET_MS", "15000")))
+    parser.add_argument("--repeat", type=int, help="Runs per CLI (median is reported)", default=3)
+    parser.add_argument("--skip-service", action="store_true", help="Only measure the CLIs")
+    parser.add_argument("--app", help="uvicorn app target, importable from this directory", default=APP_TARGET)
+    parser.add_argument("--port", type=int, help="Port for the benchmarked service", default=8765)
+    args = parser.parse_args()
+
+    main(args.cli_budget_ms, args.health_budget_ms, args.ready_budget_ms, args.repeat,
+         args.skip_service, args.app, args.port)
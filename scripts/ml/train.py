@@ -10,17 +10,15 @@ Saves:
 
 import os
 import numpy as np
-import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-import joblib
-import tensorflow as tf
+from feature_cache import load_or_build, source_fingerprint
 
 MODEL_DIR = os.path.join(os.path.dirname(__file__), "model_saved")
 os.makedirs(MODEL_DIR, exist_ok=True)
 
 def load_dataset(csv_path=None):
     """Load dataset from CSV or generate synthetic data for prototyping"""
+    import pandas as pd
+    
     if csv_path and os.path.exists(csv_path):
         df = pd.read_csv(csv_path)
         # Expect columns: calories, protein, carbs, fat, iron, vitaminC, age, gender, dosha
@@ -76,7 +74,7 @@ def prepare_features(df):
     
     # One-hot encode dosha
     dosha = df["dosha"].astype(int).values
-    dosha_ohe = tf.keras.utils.to_categorical(dosha, num_classes=3).astype(np.float32)
+    dosha_ohe = np.eye(3, dtype=np.float32)[dosha]
     
     # Combine numeric and categorical features
     X = np.concatenate([X_numeric, dosha_ohe], axis=1)
@@ -86,8 +84,59 @@ def prepare_features(df):
     
     return X, y, feature_cols
 
+def prepare_training_data(csv_path=None, use_cache=True):
+    """
+    Load, split and scale the dataset, reusing the feature cache when possible
+    
+    Returns:
+        X_train, X_val, y_train, y_val, fitted scaler, numeric feature names
+    """
+    config = {
+        "feature_cols": ["calories", "protein", "carbs", "fat", "iron", "vitaminC", "age", "gender"],
+        "label_cols": ["iron_def", "vitc_def", "protein_def"],
+        "dosha_classes": 3,
+        "test_size": 0.15,
+        "random_state": 42,
+        "stratify": "iron_def",
+        "scaled_columns": 8
+    }
+    
+    def build():
+        from sklearn.model_selection import train_test_split
+        from sklearn.preprocessing import StandardScaler
+        
+        df = load_dataset(csv_path)
+        print(f"Dataset loaded with {len(df)} samples")
+        
+        X, y, _ = prepare_features(df)
+        print(f"Features prepared: {X.shape}, Labels: {y.shape}")
+        
+        # Split data
+        X_train, X_val, y_train, y_val = train_test_split(
+            X, y, test_size=config["test_size"], random_state=config["random_state"],
+            stratify=y[:, 0]  # Stratify on iron deficiency
+        )
+        
+        # Scale numeric features (first 8 columns)
+        scaler = StandardScaler()
+        X_train[:, :8] = scaler.fit_transform(X_train[:, :8])
+        X_val[:, :8] = scaler.transform(X_val[:, :8])
+        
+        arrays = {"X_train": X_train, "X_val": X_val, "y_train": y_train, "y_val": y_val}
+        return arrays, scaler
+    
+    if use_cache:
+        source = source_fingerprint(csv_path, synthetic_tag="train-n10000-seed42")
+        arrays, scaler = load_or_build("train", source, config, build)
+    else:
+        arrays, scaler = build()
+    
+    return arrays["X_train"], arrays["X_val"], arrays["y_train"], arrays["y_val"], scaler, config["feature_cols"]
+
 def build_model(input_dim):
     """Build and compile the neural network model"""
+    import tensorflow as tf
+    
     model = tf.keras.Sequential([
         tf.keras.layers.Input(shape=(input_dim,)),
         tf.keras.layers.Dense(128, activation='relu'),
@@ -108,26 +157,15 @@ def build_model(input_dim):
     
     return model
 
-def main(csv_path=None):
+def main(csv_path=None, use_cache=True):
     """Main training function"""
-    print("Starting ML model training...")
+    import joblib
+    import tensorflow as tf
     
-    # Load and prepare data
-    df = load_dataset(csv_path)
-    print(f"Dataset loaded with {len(df)} samples")
-    
-    X, y, feature_cols = prepare_features(df)
-    print(f"Features prepared: {X.shape}, Labels: {y.shape}")
-    
-    # Split data
-    X_train, X_val, y_train, y_val = train_test_split(
-        X, y, test_size=0.15, random_state=42, stratify=y[:, 0]  # Stratify on iron deficiency
-    )
+    print("Starting ML model training...")
     
-    # Scale numeric features (first 8 columns)
-    scaler = StandardScaler()
-    X_train[:, :8] = scaler.fit_transform(X_train[:, :8])
-    X_val[:, :8] = scaler.transform(X_val[:, :8])
+    # Load, split and scale data (cached across runs on the same dataset)
+    X_train, X_val, y_train, y_val, scaler, feature_cols = prepare_training_data(csv_path, use_cache)
     
     print("Data preprocessing completed")
     
@@ -200,6 +238,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Train nutrient deficiency prediction model')
     parser.add_argument("--csv", help="Path to dataset CSV (optional)", default=None)
     parser.add_argument("--epochs", type=int, help="Number of training epochs", default=100)
+    parser.add_argument("--no-cache", action="store_true", help="Rebuild features instead of using the feature cache")
     args = parser.parse_args()
     
-    main(args.csv)
+    main(args.csv, use_cache=not args.no_cache)